@@ -2,13 +2,20 @@
 
 import argparse
 import asyncio
+import gc
+import hashlib
 import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List
 from urllib.parse import unquote
 
-from fastapi import FastAPI, HTTPException, Response
+import orjson
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import ValidationError
 
 from .types.chat.chat_completion import (
     ChatCompletionRequest,
@@ -17,15 +24,29 @@ from .types.chat.chat_completion import (
 )
 from .types.model import SupportedModels
 
+# Rust-backed parallel downloads for first-time model fetches; must be set
+# before huggingface_hub is imported (below, via mlx_lm/mlx_vlm). Only
+# enabled when the optional package is actually installed, since the hub
+# errors out if the flag is set without it. Reruns hit the local cache,
+# which is relocatable via the standard HF_HOME env var.
 try:
+    import hf_transfer  # noqa: F401
+
+    os.environ.setdefault("HF_HUB_ENABLE_HF_TRANSFER", "1")
+except ImportError:
+    pass
+
+try:
+    import mlx.core as mx
     from mlx_vlm import generate as vlm_generate
     from mlx_vlm.prompt_utils import apply_chat_template as apply_vlm_chat_template
     from mlx_vlm.utils import load_config
 
     from .utils import (
-        MODEL_REMAPPING,
         MODELS,
         apply_lm_chat_template,
+        clear_prompt_cache,
+        fetch_image,
         get_eom_token,
         get_tool_prompt,
         handle_function_calls,
@@ -33,6 +54,7 @@ try:
         lm_stream_generator,
         load_lm_model,
         load_vlm_model,
+        resolve_model_type,
         vlm_stream_generator,
     )
 
@@ -42,19 +64,187 @@ except ImportError:
     MLX_AVAILABLE = False
 
 
+class BatchScheduler:
+    """Coalesce concurrent generation requests for the same model into batches.
+
+    LLM decode is memory-bound, so running queued requests back-to-back while
+    the weights are resident amortizes weight I/O across requests instead of
+    paying it once per interleaved call. Each model gets its own queue and
+    background worker; ``submit`` enqueues a generation call and awaits its
+    result.
+    """
+
+    def __init__(self, max_batch_size: int = None, batch_window: float = None):
+        self.max_batch_size = max_batch_size or int(
+            os.getenv("FASTMLX_MAX_BATCH_SIZE", "8")
+        )
+        self.batch_window = batch_window or float(
+            os.getenv("FASTMLX_BATCH_WINDOW", "0.005")
+        )
+        self.queues: Dict[tuple, asyncio.Queue] = {}
+        self.workers: Dict[tuple, asyncio.Task] = {}
+        # MLX serializes GPU work anyway; one batch in flight at a time
+        # avoids context thrash between models.
+        self.gpu_lock = asyncio.Semaphore(1)
+        # Dedicated pool so generation threads aren't contended by (or
+        # starving) asyncio's default executor, which also serves file I/O
+        # and to_thread callers elsewhere in the app. MLX releases the GIL
+        # during array ops, so threads suffice.
+        self.pool = ThreadPoolExecutor(
+            max_workers=min(4, os.cpu_count() or 1),
+            thread_name_prefix="fastmlx-gen",
+        )
+
+    # Queue bins by requested output length: a short completion queued
+    # behind a long one on the same model would otherwise wait for the
+    # whole decode, so each bucket gets its own queue and worker and the
+    # gpu_lock interleaves them per item.
+    BUCKET_BOUNDS = (64, 256, 1024)
+
+    @classmethod
+    def _bucket(cls, max_tokens):
+        if max_tokens is not None:
+            for bucket, bound in enumerate(cls.BUCKET_BOUNDS):
+                if max_tokens <= bound:
+                    return bucket
+        return len(cls.BUCKET_BOUNDS)
+
+    def queue_depths(self) -> Dict[str, int]:
+        return {
+            f"{model}/bucket{bucket}": queue.qsize()
+            for (model, bucket), queue in self.queues.items()
+        }
+
+    async def submit(
+        self, model_name: str, generate_fn, *args, max_tokens_hint=None, **kwargs
+    ):
+        key = (model_name, self._bucket(max_tokens_hint))
+        queue = self.queues.get(key)
+        if queue is None:
+            queue = self.queues[key] = asyncio.Queue()
+            self.workers[key] = asyncio.create_task(self._worker(queue))
+        future = asyncio.get_running_loop().create_future()
+        await queue.put((generate_fn, args, kwargs, future))
+        return await future
+
+    async def _collect_batch(self, queue: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        batch = [await queue.get()]
+        deadline = loop.time() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    @staticmethod
+    def _run_one(generate_fn, args, kwargs):
+        try:
+            return True, generate_fn(*args, **kwargs)
+        except Exception as e:
+            return False, e
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            batch = await self._collect_batch(queue)
+            # Continuous admission: as each sequence finishes, refill the
+            # active set from the queue so late arrivals don't wait for the
+            # whole batch to drain before being scheduled.
+            while batch:
+                generate_fn, args, kwargs, future = batch.pop(0)
+                if not future.cancelled():
+                    # Run generation on the dedicated pool so it never
+                    # blocks the event loop.
+                    async with self.gpu_lock:
+                        ok, value = await asyncio.get_running_loop().run_in_executor(
+                            self.pool, self._run_one, generate_fn, args, kwargs
+                        )
+                    if not future.cancelled():
+                        if ok:
+                            future.set_result(value)
+                        else:
+                            future.set_exception(value)
+                while len(batch) < self.max_batch_size and not queue.empty():
+                    batch.append(queue.get_nowait())
+
+
 class ModelProvider:
-    def __init__(self):
-        self.models: Dict[str, Dict[str, Any]] = {}
+    def __init__(self, capacity: int = None):
+        # LRU-ordered: least recently used model first. A None capacity
+        # leaves the cache unbounded.
+        self.models: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.capacity = capacity
         self.lock = asyncio.Lock()
-
-    def load_model(self, model_name: str):
-        if model_name not in self.models:
-            config = load_config(model_name)
-            model_type = MODEL_REMAPPING.get(config["model_type"], config["model_type"])
-            if model_type in MODELS["vlm"]:
-                self.models[model_name] = load_vlm_model(model_name, config)
+        self.model_locks: Dict[str, asyncio.Lock] = {}
+        self.scheduler = BatchScheduler()
+
+    def _evict_lru(self):
+        _, model_data = self.models.popitem(last=False)
+        del model_data
+        # Loaded weights hold multi-GB Metal buffers; collect eagerly so
+        # the memory is back before the replacement model loads.
+        gc.collect()
+        if MLX_AVAILABLE:
+            mx.metal.clear_cache()
+
+    def _load_model_sync(self, model_name: str) -> Dict[str, Any]:
+        config = load_config(model_name)
+        model_type, is_vlm = resolve_model_type(config["model_type"])
+        if is_vlm:
+            model_data = load_vlm_model(model_name, config)
+        else:
+            model_data = load_lm_model(model_name, config)
+        # Resolved once per model so the per-request dispatch path is free
+        # of remapping lookups and tools-config reads.
+        model_data["model_type"] = model_type
+        model_data["is_vlm"] = is_vlm
+        model_data["stop_words"] = get_eom_token(model_name)
+        return model_data
+
+    def _warmup_model(self, model_data: Dict[str, Any]):
+        """Run a throwaway template render and 1-token generate so the first
+        real request hits warm Metal kernels and a compiled chat template."""
+        messages = [{"role": "user", "content": "hi"}]
+        try:
+            if "tokenizer" in model_data:
+                tokenizer = model_data["tokenizer"]
+                prompt = "hi"
+                if getattr(tokenizer, "chat_template", None):
+                    prompt = tokenizer.apply_chat_template(
+                        messages, tokenize=False, add_generation_prompt=True
+                    )
+                lm_generate(model_data["model"], tokenizer, prompt, max_tokens=1)
             else:
-                self.models[model_name] = load_lm_model(model_name, config)
+                apply_vlm_chat_template(
+                    model_data["processor"], model_data["config"], messages
+                )
+        except Exception as e:
+            print(f"Warning: model warmup failed: {e}")
+
+    async def load_model(self, model_name: str):
+        if model_name in self.models:
+            self.models.move_to_end(model_name)
+            return self.models[model_name]
+
+        # Per-model lock so concurrent cold requests for the same model load
+        # the weights exactly once instead of racing through disk and memory.
+        async with self.lock:
+            model_lock = self.model_locks.setdefault(model_name, asyncio.Lock())
+
+        async with model_lock:
+            if model_name not in self.models:
+                while self.capacity and len(self.models) >= self.capacity:
+                    self._evict_lru()
+                self.models[model_name] = await asyncio.to_thread(
+                    self._load_model_sync, model_name
+                )
+                asyncio.create_task(
+                    asyncio.to_thread(self._warmup_model, self.models[model_name])
+                )
 
         return self.models[model_name]
 
@@ -62,6 +252,8 @@ class ModelProvider:
         async with self.lock:
             if model_name in self.models:
                 del self.models[model_name]
+                if MLX_AVAILABLE:
+                    clear_prompt_cache()
                 return True
             return False
 
@@ -70,7 +262,7 @@ class ModelProvider:
             return list(self.models.keys())
 
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 
 # Custom type function
@@ -105,23 +297,99 @@ def setup_cors(app: FastAPI, allowed_origins: List[str]):
     )
 
 
-# Initialize the ModelProvider
-model_provider = ModelProvider()
+# Initialize the ModelProvider. Settings come from the environment rather
+# than CLI state because uvicorn re-imports the app in each worker process,
+# so anything set on the parent's objects would silently revert there.
+_capacity_env = os.getenv("FASTMLX_MAX_LOADED_MODELS")
+model_provider = ModelProvider(capacity=int(_capacity_env) if _capacity_env else None)
+
+_pld_env = os.getenv("FASTMLX_PLD_THRESHOLD")
+app.state.pld_threshold = float(_pld_env) if _pld_env else None
+
+
+@app.on_event("startup")
+async def prewarm_models():
+    """Eagerly load models named in ``FASTMLX_PREWARM`` (comma-separated)
+    so the first real request doesn't pay the cold-load cost inline.
+
+    Loads run concurrently; the per-model locks in ``load_model`` collapse
+    duplicate requests that arrive while a prewarm is still in flight.
+    """
+    prewarm = os.getenv("FASTMLX_PREWARM", "")
+    names = [name.strip() for name in prewarm.split(",") if name.strip()]
+    if not names:
+        return
+    results = await asyncio.gather(
+        *(model_provider.load_model(name) for name in names),
+        return_exceptions=True,
+    )
+    for name, result in zip(names, results):
+        if isinstance(result, Exception):
+            print(f"Warning: prewarm of {name} failed: {result}")
+
+
+async def parse_chat_request(raw_request: Request) -> ChatCompletionRequest:
+    """Validate straight from the raw body bytes.
+
+    Pydantic v2's Rust core parses and validates in one pass, skipping
+    FastAPI's json.loads -> dict -> validate round trip on the hot path.
+    """
+    try:
+        return ChatCompletionRequest.model_validate_json(await raw_request.body())
+    except ValidationError as e:
+        # Prepend "body" so 422 locations match what FastAPI's own body
+        # validation reports.
+        errors = [{**err, "loc": ("body",) + tuple(err["loc"])} for err in e.errors()]
+        raise RequestValidationError(errors)
+
+
+# The hand-declared request schema refs sub-models in components.schemas,
+# so its $defs are lifted out here and merged into the spec below.
+_chat_request_schema = ChatCompletionRequest.model_json_schema(
+    ref_template="#/components/schemas/{model}"
+)
+_chat_request_defs = _chat_request_schema.pop("$defs", {})
+
+_base_openapi = app.openapi
+
+
+def _openapi_with_chat_defs():
+    if app.openapi_schema is None:
+        schema = _base_openapi()
+        schema.setdefault("components", {}).setdefault("schemas", {}).update(
+            _chat_request_defs
+        )
+    return app.openapi_schema
+
+
+app.openapi = _openapi_with_chat_defs
 
 
-@app.post("/v1/chat/completions", response_model=ChatCompletionResponse)
-async def chat_completion(request: ChatCompletionRequest):
+# responses= keeps the OpenAPI schema accurate without making FastAPI
+# re-validate the already-constructed response model on every completion.
+@app.post(
+    "/v1/chat/completions",
+    responses={200: {"model": ChatCompletionResponse}},
+    openapi_extra={
+        "requestBody": {
+            "content": {"application/json": {"schema": _chat_request_schema}},
+            "required": True,
+        }
+    },
+)
+async def chat_completion(
+    request: ChatCompletionRequest = Depends(parse_chat_request),
+):
     if not MLX_AVAILABLE:
         raise HTTPException(status_code=500, detail="MLX library not available")
 
     stream = request.stream
-    model_data = model_provider.load_model(request.model)
+    model_data = await model_provider.load_model(request.model)
     model = model_data["model"]
     config = model_data["config"]
-    model_type = MODEL_REMAPPING.get(config["model_type"], config["model_type"])
-    stop_words = get_eom_token(request.model)
+    stop_words = model_data["stop_words"]
 
-    if model_type in MODELS["vlm"]:
+    if model_data["is_vlm"]:
         processor = model_data["processor"]
         image_processor = model_data["image_processor"]
 
@@ -132,24 +400,37 @@ async def chat_completion(request: ChatCompletionRequest):
             if isinstance(msg.content, str):
                 chat_messages.append({"role": msg.role, "content": msg.content})
             elif isinstance(msg.content, list):
-                text_content = ""
-                for content_part in msg.content:
-                    if content_part.type == "text":
-                        text_content += content_part.text + " "
-                    elif content_part.type == "image_url":
-                        image_url = content_part.image_url["url"]
-                chat_messages.append(
-                    {"role": msg.role, "content": text_content.strip()}
+                text_content = " ".join(
+                    part.text for part in msg.content if part.type == "text"
+                )
+                image_url = next(
+                    (
+                        part.image_url["url"]
+                        for part in msg.content
+                        if part.type == "image_url"
+                    ),
+                    image_url,
                 )
+                chat_messages.append({"role": msg.role, "content": text_content})
 
-        if not image_url and model_type in MODELS["vlm"]:
+        if not image_url:
             raise HTTPException(
                 status_code=400, detail="Image URL not provided for VLM model"
             )
 
-        prompt = ""
+        image = image_url
         if model.config.model_type != "paligemma":
-            prompt = apply_vlm_chat_template(processor, config, chat_messages)
+            if image_url.startswith(("http://", "https://")):
+                # Overlap the network fetch with prompt templating instead of
+                # letting generation download the image serially afterwards.
+                image, prompt = await asyncio.gather(
+                    asyncio.to_thread(fetch_image, image_url),
+                    asyncio.to_thread(
+                        apply_vlm_chat_template, processor, config, chat_messages
+                    ),
+                )
+            else:
+                prompt = apply_vlm_chat_template(processor, config, chat_messages)
         else:
             prompt = chat_messages[-1]["content"]
 
@@ -159,22 +440,26 @@ async def chat_completion(request: ChatCompletionRequest):
                     model,
                     request.model,
                     processor,
-                    image_url,
+                    image,
                     prompt,
                     image_processor,
                     request.max_tokens,
                     request.temperature,
+                    sse_batch_size=(request.stream_options or {}).get("batch_size"),
                 ),
                 media_type="text/event-stream",
             )
         else:
             # Generate the response
-            output = vlm_generate(
+            output = await model_provider.scheduler.submit(
+                request.model,
+                vlm_generate,
                 model,
                 processor,
-                image_url,
+                image,
                 prompt,
                 image_processor,
+                max_tokens_hint=request.max_tokens,
                 max_tokens=request.max_tokens,
                 temp=request.temperature,
                 verbose=False,
@@ -219,21 +504,30 @@ async def chat_completion(request: ChatCompletionRequest):
                     request.max_tokens,
                     request.temperature,
                     stop_words=stop_words,
+                    sse_batch_size=(request.stream_options or {}).get("batch_size"),
                 ),
                 media_type="text/event-stream",
             )
         else:
-            output = lm_generate(
+            output = await model_provider.scheduler.submit(
+                request.model,
+                lm_generate,
                 model,
                 tokenizer,
                 prompt,
                 request.max_tokens,
+                max_tokens_hint=request.max_tokens,
                 temp=request.temperature,
                 stop_words=stop_words,
+                pld_threshold=getattr(app.state, "pld_threshold", None),
             )
 
     # Parse the output to check for function calls
-    return handle_function_calls(output, request)
+    return ORJSONResponse(handle_function_calls(output, request).model_dump())
+
+
+# Serialized once and reused on every hit; rebuilt only if MODELS is swapped.
+_supported_models_cache: Dict[str, Any] = {"source": None}
 
 
 @app.get("/v1/supported_models", response_model=SupportedModels)
@@ -241,7 +535,16 @@ async def get_supported_models():
     """
     Get a list of supported model types for VLM and LM.
     """
-    return JSONResponse(content=MODELS)
+    if _supported_models_cache["source"] is not MODELS:
+        body = orjson.dumps(MODELS)
+        _supported_models_cache.update(
+            source=MODELS, body=body, etag=hashlib.md5(body).hexdigest()
+        )
+    return Response(
+        content=_supported_models_cache["body"],
+        media_type="application/json",
+        headers={"ETag": _supported_models_cache["etag"]},
+    )
 
 
 @app.get("/v1/models")
@@ -249,9 +552,17 @@ async def list_models():
     return {"models": await model_provider.get_available_models()}
 
 
+@app.get("/v1/queues")
+async def get_queue_depths():
+    """
+    Get the pending request count per scheduler queue.
+    """
+    return {"queues": model_provider.scheduler.queue_depths()}
+
+
 @app.post("/v1/models")
 async def add_model(model_name: str):
-    model_provider.load_model(model_name)
+    await model_provider.load_model(model_name)
     return {"status": "success", "message": f"Model {model_name} added successfully"}
 
 
@@ -279,6 +590,23 @@ def run():
     parser.add_argument(
         "--port", type=int, default=8000, help="Port to run the server on"
     )
+    parser.add_argument(
+        "--max-loaded-models",
+        type=int,
+        default=None,
+        help="""Maximum number of models kept in memory at once. When the
+        limit is reached the least recently used model is evicted before a
+        new one loads. Defaults to None (unbounded).""",
+    )
+    parser.add_argument(
+        "--pld-threshold",
+        type=float,
+        default=None,
+        help="""Predictive Layer Dropping threshold. Skips transformer layers
+        whose hidden-state delta falls below the threshold, trading a bit of
+        quality for tokens/sec. Requires an mlx-lm build with PLD support;
+        ignored otherwise. Defaults to None (disabled).""",
+    )
     parser.add_argument(
         "--reload",
         type=bool,
@@ -310,15 +638,36 @@ def run():
 
     setup_cors(app, args.allowed_origins)
 
+    # Exported to the environment so uvicorn worker processes, which
+    # re-import the app, inherit the settings; also applied in-process for
+    # the single-worker path where the app is already imported.
+    if args.max_loaded_models is not None:
+        os.environ["FASTMLX_MAX_LOADED_MODELS"] = str(args.max_loaded_models)
+        model_provider.capacity = args.max_loaded_models
+    if args.pld_threshold is not None:
+        os.environ["FASTMLX_PLD_THRESHOLD"] = str(args.pld_threshold)
+        app.state.pld_threshold = args.pld_threshold
+
     import uvicorn
 
+    try:
+        # uvloop + httptools cut per-request event-loop and HTTP-parse
+        # overhead substantially; fall back to stdlib if not installed.
+        import httptools  # noqa: F401
+        import uvloop  # noqa: F401
+
+        loop, http = "uvloop", "httptools"
+    except ImportError:
+        loop, http = "asyncio", "auto"
+
     uvicorn.run(
         "fastmlx:app",
         host=args.host,
         port=args.port,
         reload=args.reload,
         workers=args.workers,
-        loop="asyncio",
+        loop=loop,
+        http=http,
     )
 
 
@@ -1,5 +1,7 @@
+from dataclasses import dataclass
 from typing import Any, Dict, List, Literal, Optional, Union
 
+import orjson
 from pydantic import BaseModel, Field
 
 
@@ -22,8 +24,8 @@ class Function(BaseModel):
 
 class ChatCompletionContentPartParam(BaseModel):
     type: Literal["text", "image_url"]
-    text: str = None
-    image_url: dict = None
+    text: Optional[str] = None
+    image_url: Optional[dict] = None
 
 
 class ChatMessage(BaseModel):
@@ -37,6 +39,7 @@ class ChatCompletionRequest(BaseModel):
     image: Optional[str] = Field(default=None)
     max_tokens: Optional[int] = Field(default=100)
     stream: Optional[bool] = Field(default=False)
+    stream_options: Optional[Dict[str, Any]] = Field(default=None)
     temperature: Optional[float] = Field(default=0.2)
     tools: Optional[List[Function]] = Field(default=None)
     tool_choice: Optional[str] = Field(default=None)
@@ -51,9 +54,33 @@ class ChatCompletionResponse(BaseModel):
     tool_calls: Optional[List[ToolCall]] = None
 
 
-class ChatCompletionChunk(BaseModel):
+@dataclass
+class StreamChunk:
+    """Envelope for streamed completion chunks.
+
+    A plain dataclass rather than a Pydantic model: chunks are write-only,
+    so per-frame validation buys nothing on the decode hot loop. The
+    request-constant halves of the SSE frame are formatted once; ``to_sse``
+    JSON-escapes only the delta content between them, keeping the wire
+    format identical to the OpenAI chat.completion.chunk schema.
+    """
+
     id: str
-    object: str = "chat.completion.chunk"
     created: int
     model: str
-    choices: List[Dict[str, Any]]
+
+    def __post_init__(self):
+        # bytes end to end: StreamingResponse sends bytes chunks as-is,
+        # so no per-frame utf-8 encode happens downstream.
+        self._prefix = (
+            f'data: {{"id": {orjson.dumps(self.id).decode()}, '
+            f'"object": "chat.completion.chunk", '
+            f'"created": {self.created}, '
+            f'"model": {orjson.dumps(self.model).decode()}, '
+            f'"choices": [{{"index": 0, '
+            f'"delta": {{"role": "assistant", "content": '
+        ).encode()
+        self._suffix = b'}, "finish_reason": null}]}\n\n'
+
+    def to_sse(self, content: str) -> bytes:
+        return self._prefix + orjson.dumps(content) + self._suffix
@@ -0,0 +1,107 @@
+"""Shared fixtures: one mocked app client for the whole session."""
+
+from unittest.mock import patch
+
+import pytest_asyncio
+from httpx import ASGITransport, AsyncClient
+
+from fastmlx import ModelProvider, app
+
+
+# Placeholder for model objects the mocked generate functions never touch;
+# far cheaper than a MagicMock per field and per model.
+class _StubConfig:
+    # Anything but "paligemma": the VLM branch reads model.config.model_type
+    # to pick its prompt strategy.
+    model_type = "test"
+
+
+class _Stub:
+    # No template steers apply_lm_chat_template onto its fallback path.
+    chat_template = None
+    config = _StubConfig()
+
+
+_STUB = _Stub()
+
+
+# Mock MODELS dictionary
+MODELS = {"vlm": ["llava"], "lm": ["phi"]}
+
+# Name fragments that mark a mock model as a VLM; checked against one
+# lowercased copy of the name per load.
+_VLM_TOKENS = ("llava",)
+
+
+# Create mock classes that inherit from the original classes
+class MockModelProvider(ModelProvider):
+    def __init__(self):
+        super().__init__()
+        self.models = {}
+
+    async def load_model(self, model_name: str):
+        if model_name not in self.models:
+            lower = model_name.lower()
+            model_type = "vlm" if any(t in lower for t in _VLM_TOKENS) else "lm"
+            self.models[model_name] = {
+                "model": _STUB,
+                "processor": _STUB,
+                "tokenizer": _STUB,
+                "image_processor": _STUB if model_type == "vlm" else None,
+                "config": {"model_type": model_type},
+                "model_type": model_type,
+                "is_vlm": model_type == "vlm",
+                "stop_words": None,
+            }
+        return self.models[model_name]
+
+    async def remove_model(self, model_name: str) -> bool:
+        if model_name in self.models:
+            del self.models[model_name]
+            return True
+        return False
+
+    async def get_available_models(self):
+        return list(self.models.keys())
+
+
+# Mock functions
+def mock_generate(*args, **kwargs):
+    return "generated response"
+
+
+def mock_apply_vlm_chat_template(*args, **kwargs):
+    return "mock prompt"
+
+
+def mock_vlm_stream_generate(*args, **kwargs):
+    yield "Hello"
+    yield " world"
+    yield "!"
+
+
+def mock_lm_stream_generate(*args, **kwargs):
+    yield "Testing"
+    yield " stream"
+    yield " generation"
+
+
+# One async client (and one ASGI lifespan) for the whole session; tests run
+# on the real event loop and can issue concurrent requests.
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
+async def client():
+    # Apply patches
+    with patch("fastmlx.fastmlx.model_provider", MockModelProvider()), patch(
+        "fastmlx.fastmlx.vlm_generate", mock_generate
+    ), patch("fastmlx.fastmlx.lm_generate", mock_generate), patch(
+        "fastmlx.fastmlx.MODELS", MODELS
+    ), patch(
+        "fastmlx.fastmlx.apply_vlm_chat_template", mock_apply_vlm_chat_template
+    ), patch(
+        "fastmlx.utils.vlm_stream_generate", mock_vlm_stream_generate
+    ), patch(
+        "fastmlx.utils.lm_stream_generate", mock_lm_stream_generate
+    ):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://testserver") as c:
+            yield c
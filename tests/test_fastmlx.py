@@ -2,123 +2,101 @@
 
 """Tests for `fastmlx` package."""
 
+import asyncio
 import json
-from unittest.mock import MagicMock, patch
+from unittest.mock import MagicMock
 
 import pytest
-from fastapi.testclient import TestClient
 
 # Import the actual classes and functions
 from fastmlx import (
     ChatCompletionRequest,
     ChatCompletionResponse,
     ChatMessage,
-    ModelProvider,
-    app,
     handle_function_calls,
 )
 
+# Request payloads built and serialized once; Pydantic validation doesn't
+# need to rerun per test invocation. The VLM image rides in the message
+# content parts, which is where the endpoint looks for it.
+_VLM_REQ_BYTES = (
+    ChatCompletionRequest(
+        model="test_llava_model",
+        messages=[
+            ChatMessage(
+                role="user",
+                content=[
+                    {"type": "text", "text": "Hello"},
+                    {"type": "image_url", "image_url": {"url": "test_image"}},
+                ],
+            )
+        ],
+    )
+    .model_dump_json()
+    .encode()
+)
 
-# Create mock classes that inherit from the original classes
-class MockModelProvider(ModelProvider):
-    def __init__(self):
-        super().__init__()
-        self.models = {}
-
-    def load_model(self, model_name: str):
-        if model_name not in self.models:
-            model_type = "vlm" if "llava" in model_name.lower() else "lm"
-            self.models[model_name] = {
-                "model": MagicMock(),
-                "processor": MagicMock(),
-                "tokenizer": MagicMock(),
-                "image_processor": MagicMock() if model_type == "vlm" else None,
-                "config": {"model_type": model_type},
-            }
-        return self.models[model_name]
-
-    async def remove_model(self, model_name: str) -> bool:
-        if model_name in self.models:
-            del self.models[model_name]
-            return True
-        return False
-
-    async def get_available_models(self):
-        return list(self.models.keys())
-
-
-# Mock MODELS dictionary
-MODELS = {"vlm": ["llava"], "lm": ["phi"]}
-
-
-# Mock functions
-def mock_generate(*args, **kwargs):
-    return "generated response"
-
-
-def mock_vlm_stream_generate(*args, **kwargs):
-    yield "Hello"
-    yield " world"
-    yield "!"
-
-
-def mock_lm_stream_generate(*args, **kwargs):
-    yield "Testing"
-    yield " stream"
-    yield " generation"
-
+_LM_REQ_BYTES = (
+    ChatCompletionRequest(
+        model="test_phi_model", messages=[ChatMessage(role="user", content="Hello")]
+    )
+    .model_dump_json()
+    .encode()
+)
 
-@pytest.fixture(scope="module")
-def client():
-    # Apply patches
-    with patch("fastmlx.fastmlx.model_provider", MockModelProvider()), patch(
-        "fastmlx.fastmlx.vlm_generate", mock_generate
-    ), patch("fastmlx.fastmlx.lm_generate", mock_generate), patch(
-        "fastmlx.fastmlx.MODELS", MODELS
-    ), patch(
-        "fastmlx.utils.vlm_stream_generate", mock_vlm_stream_generate
-    ), patch(
-        "fastmlx.utils.lm_stream_generate", mock_lm_stream_generate
-    ):
-        yield TestClient(app)
+_JSON_HEADERS = {"content-type": "application/json"}
 
 
-def test_chat_completion_vlm(client):
-    request = ChatCompletionRequest(
-        model="test_llava_model",
-        messages=[ChatMessage(role="user", content="Hello")],
-        image="test_image",
-    )
-    response = client.post(
-        "/v1/chat/completions", json=json.loads(request.model_dump_json())
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.parametrize("payload", [_VLM_REQ_BYTES, _LM_REQ_BYTES], ids=["vlm", "lm"])
+async def test_chat_completion(client, payload):
+    response = await client.post(
+        "/v1/chat/completions", content=payload, headers=_JSON_HEADERS
     )
 
     assert response.status_code == 200
     assert "generated response" in response.json()["choices"][0]["message"]["content"]
 
 
-def test_chat_completion_lm(client):
-    request = ChatCompletionRequest(
-        model="test_phi_model", messages=[ChatMessage(role="user", content="Hello")]
-    )
-    response = client.post(
-        "/v1/chat/completions", json=json.loads(request.model_dump_json())
+@pytest.mark.asyncio(loop_scope="session")
+async def test_chat_completion_concurrent(client):
+    # Concurrent requests exercise the batching scheduler rather than the
+    # one-at-a-time path the sync client forced.
+    payload = {
+        "model": "test_phi_model",
+        "messages": [{"role": "user", "content": "Hello"}],
+    }
+    responses = await asyncio.gather(
+        *[client.post("/v1/chat/completions", json=payload) for _ in range(8)]
     )
 
-    assert response.status_code == 200
-    assert "generated response" in response.json()["choices"][0]["message"]["content"]
+    for response in responses:
+        assert response.status_code == 200
+        assert (
+            "generated response" in response.json()["choices"][0]["message"]["content"]
+        )
 
 
-@pytest.mark.asyncio
+@pytest.mark.asyncio(loop_scope="session")
 async def test_vlm_streaming(client):
 
     # Mock the vlm_stream_generate function
-    response = client.post(
+    response = await client.post(
         "/v1/chat/completions",
         json={
             "model": "test_llava_model",
-            "messages": [{"role": "user", "content": "Describe this image"}],
-            "image": "base64_encoded_image_data",
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": "Describe this image"},
+                        {
+                            "type": "image_url",
+                            "image_url": {"url": "base64_encoded_image_data"},
+                        },
+                    ],
+                }
+            ],
             "stream": True,
         },
     )
@@ -126,8 +104,9 @@ async def test_vlm_streaming(client):
     assert response.status_code == 200
     assert response.headers["content-type"].startswith("text/event-stream")
 
+    # Tokens are coalesced into SSE frames; the three mock tokens fit in one.
     chunks = list(response.iter_lines())
-    assert len(chunks) == 8  # 7 content chunks + [DONE]
+    assert len(chunks) == 4  # 1 content chunk + [DONE]
     for chunk in chunks[:-2]:  # Exclude the [DONE] message
         if chunk:
             chunk = chunk.split("data: ")[1]
@@ -140,16 +119,17 @@ async def test_vlm_streaming(client):
             assert data["choices"][0]["index"] == 0
             assert "delta" in data["choices"][0]
             assert "role" in data["choices"][0]["delta"]
-            assert "content" in data["choices"][0]["delta"]
+            # The VLM mock's tokens, proving the request took the VLM branch.
+            assert data["choices"][0]["delta"]["content"] == "Hello world!"
 
     assert chunks[-2] == "data: [DONE]"
 
 
-@pytest.mark.asyncio
+@pytest.mark.asyncio(loop_scope="session")
 async def test_lm_streaming(client):
 
     # Mock the lm_stream_generate function
-    response = client.post(
+    response = await client.post(
         "/v1/chat/completions",
         json={
             "model": "test_phi_model",
@@ -161,8 +141,9 @@ async def test_lm_streaming(client):
     assert response.status_code == 200
     assert response.headers["content-type"].startswith("text/event-stream")
 
+    # Tokens are coalesced into SSE frames; the three mock tokens fit in one.
     chunks = list(response.iter_lines())
-    assert len(chunks) == 8  # 7 content chunks + [DONE]
+    assert len(chunks) == 4  # 1 content chunk + [DONE]
 
     for chunk in chunks[:-2]:  # Exclude the [DONE] message
         if chunk:
@@ -176,13 +157,46 @@ async def test_lm_streaming(client):
             assert data["choices"][0]["index"] == 0
             assert "delta" in data["choices"][0]
             assert "role" in data["choices"][0]["delta"]
-            assert "content" in data["choices"][0]["delta"]
+            assert data["choices"][0]["delta"]["content"] == "Testing stream generation"
 
     assert chunks[-2] == "data: [DONE]"
 
 
-def test_get_supported_models(client):
-    response = client.get("/v1/supported_models")
+@pytest.mark.asyncio(loop_scope="session")
+async def test_lm_streaming_per_token(client):
+    # batch_size=1 restores one SSE frame per token.
+    response = await client.post(
+        "/v1/chat/completions",
+        json={
+            "model": "test_phi_model",
+            "messages": [{"role": "user", "content": "Hello, how are you?"}],
+            "stream": True,
+            "stream_options": {"batch_size": 1},
+        },
+    )
+
+    assert response.status_code == 200
+    chunks = [c for c in response.iter_lines() if c and c != "data: [DONE]"]
+    contents = [
+        json.loads(c.split("data: ")[1])["choices"][0]["delta"]["content"]
+        for c in chunks
+    ]
+    assert contents == ["Testing", " stream", " generation"]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_queue_depths(client):
+    # Completions above ran through the scheduler, so queues exist; all
+    # should have drained by now.
+    response = await client.get("/v1/queues")
+    assert response.status_code == 200
+    queues = response.json()["queues"]
+    assert all(depth == 0 for depth in queues.values())
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_get_supported_models(client):
+    response = await client.get("/v1/supported_models")
     assert response.status_code == 200
     data = response.json()
     assert "vlm" in data
@@ -191,18 +205,20 @@ def test_get_supported_models(client):
     assert data["lm"] == ["phi"]
 
 
-def test_list_models(client):
-    client.post("/v1/models?model_name=test_llava_model")
-    client.post("/v1/models?model_name=test_phi_model")
+@pytest.mark.asyncio(loop_scope="session")
+async def test_list_models(client):
+    await client.post("/v1/models?model_name=test_llava_model")
+    await client.post("/v1/models?model_name=test_phi_model")
 
-    response = client.get("/v1/models")
+    response = await client.get("/v1/models")
 
     assert response.status_code == 200
     assert set(response.json()["models"]) == {"test_llava_model", "test_phi_model"}
 
 
-def test_add_model(client):
-    response = client.post("/v1/models?model_name=new_llava_model")
+@pytest.mark.asyncio(loop_scope="session")
+async def test_add_model(client):
+    response = await client.post("/v1/models?model_name=new_llava_model")
 
     assert response.status_code == 200
     assert response.json() == {
@@ -211,25 +227,26 @@ def test_add_model(client):
     }
 
 
-def test_remove_model(client):
+@pytest.mark.asyncio(loop_scope="session")
+async def test_remove_model(client):
     # Add a model
-    response = client.post("/v1/models?model_name=test_model")
+    response = await client.post("/v1/models?model_name=test_model")
     assert response.status_code == 200
 
     # Verify the model is added
-    response = client.get("/v1/models")
+    response = await client.get("/v1/models")
     assert "test_model" in response.json()["models"]
 
     # Remove the model
-    response = client.delete("/v1/models?model_name=test_model")
+    response = await client.delete("/v1/models?model_name=test_model")
     assert response.status_code == 204
 
     # Verify the model is removed
-    response = client.get("/v1/models")
+    response = await client.get("/v1/models")
     assert "test_model" not in response.json()["models"]
 
     # Try to remove a non-existent model
-    response = client.delete("/v1/models?model_name=non_existent_model")
+    response = await client.delete("/v1/models?model_name=non_existent_model")
     assert response.status_code == 404
     assert "Model 'non_existent_model' not found" in response.json()["detail"]
 
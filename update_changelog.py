@@ -0,0 +1,178 @@
+"""Update docs/changelog.md from the project's GitHub releases."""
+
+import operator
+import os
+import re
+import shutil
+import tempfile
+from datetime import datetime
+
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+
+REPO = "Blaizzy/fastmlx"
+API_URL = f"https://api.github.com/repos/{REPO}/releases"
+CHANGELOG_PATH = os.path.join(os.path.dirname(__file__), "docs", "changelog.md")
+ETAG_PATH = os.path.join(os.path.dirname(__file__), ".changelog_etag")
+GITHUB_TOKEN = os.getenv("GITHUB_TOKEN", "")
+
+# One session for the whole run: paginated fetches reuse the TCP/TLS
+# connection instead of paying a fresh handshake per page.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+_SESSION.headers.update({"Accept": "application/vnd.github.v3+json"})
+if GITHUB_TOKEN:
+    _SESSION.headers["Authorization"] = f"token {GITHUB_TOKEN}"
+
+_DATE_FORMAT = "%d %B %Y"
+
+# Release-note patterns, compiled once instead of per line.
+_CONTRIB_RE = re.compile(r"\* @(\w+) made their first contribution in (https://\S+)")
+_BY_RE = re.compile(r"by @(\w+) in (https://\S+)")
+_ISSUE_RE = re.compile(r"#(\d+)")
+
+
+def _read_etag():
+    try:
+        with open(ETAG_PATH, "r") as file:
+            return file.read().strip()
+    except OSError:
+        return None
+
+
+def get_releases():
+    """Fetch all releases, following GitHub's Link pagination.
+
+    The first page is a conditional GET against the ETag from the previous
+    run: a 304 carries no body, skips the JSON parse, and doesn't count
+    against GitHub's rate limit on the common no-new-release path.
+    """
+    headers = {}
+    etag = _read_etag()
+    if etag:
+        headers["If-None-Match"] = etag
+
+    releases = []
+    new_etag = None
+    url = API_URL
+    first_page = True
+    while url:
+        response = _SESSION.get(
+            url, headers=headers if first_page else None, timeout=30
+        )
+        if first_page and response.status_code == 304:
+            return []
+        response.raise_for_status()
+        if first_page:
+            new_etag = response.headers.get("ETag")
+            first_page = False
+        # orjson parses the raw bytes directly, skipping requests' charset
+        # detection and the stdlib parser.
+        releases += orjson.loads(response.content)
+        url = response.links.get("next", {}).get("url")
+
+    if new_etag:
+        with open(ETAG_PATH, "w") as file:
+            file.write(new_etag)
+    return releases
+
+
+def format_release_notes(release):
+    formatted = []
+    for line in release.get("body", "").splitlines():
+        contrib = _CONTRIB_RE.match(line)
+        if contrib:
+            username, url = contrib.groups()
+            formatted.append(
+                f"-   [@{username}](https://github.com/{username}) "
+                f"made their first contribution in {url}"
+            )
+            continue
+        line = _BY_RE.sub(r"by [@\1](https://github.com/\1) in \2", line)
+        if line.startswith("* "):
+            line = "-   " + line[2:]
+        # Issue links are rewritten here too, so each line is walked once
+        # instead of in a second pass over the whole list.
+        formatted.append(
+            _ISSUE_RE.sub(rf"[#\1](https://github.com/{REPO}/pull/\1)", line)
+        )
+
+    return "\n".join(formatted)
+
+
+def parse_version(tag):
+    return tuple(int(part) for part in tag.lstrip("v").split("."))
+
+
+_VERSION_HEADING_RE = re.compile(r"^## (v[\d.]+)")
+
+
+def _existing_versions():
+    # Scan line by line rather than loading the whole file for a findall.
+    versions = []
+    with open(CHANGELOG_PATH, "r") as file:
+        for line in file:
+            match = _VERSION_HEADING_RE.match(line)
+            if match:
+                versions.append(match.group(1))
+    return versions
+
+
+def _insert_after_header(new_content):
+    """Write the new entries just below the "# Changelog" heading.
+
+    The tail of the file is streamed through copyfileobj instead of being
+    concatenated into a second full-file string, and the temp-file plus
+    os.replace swap keeps the update atomic.
+    """
+    with open(CHANGELOG_PATH, "rb") as src, tempfile.NamedTemporaryFile(
+        "wb", dir=os.path.dirname(CHANGELOG_PATH), delete=False
+    ) as dst:
+        head = src.read(4096)
+        header_end = head.find(b"\n\n", head.find(b"# Changelog")) + 2
+        dst.write(head[:header_end])
+        dst.write(new_content.encode())
+        dst.write(head[header_end:])
+        shutil.copyfileobj(src, dst)
+    os.replace(dst.name, CHANGELOG_PATH)
+
+
+def update_changelog():
+    releases = get_releases()
+    if not releases:
+        print("Changelog is up to date")
+        return
+
+    # Parsed up front: set membership is O(1) against the per-release scan
+    # a list would cost, and each tag is parsed exactly once for both the
+    # sort key and the membership test.
+    existing_versions = frozenset(parse_version(v) for v in _existing_versions())
+    parsed_releases = sorted(
+        ((parse_version(r["tag_name"]), r) for r in releases),
+        key=operator.itemgetter(0),
+        reverse=True,
+    )
+
+    new_content = ""
+    for parsed, release in parsed_releases:
+        if parsed in existing_versions:
+            continue
+        version = release["tag_name"]
+        # fromisoformat is a C fast path; strptime recompiles its format
+        # regex on every call.
+        date = datetime.fromisoformat(
+            release["published_at"].replace("Z", "+00:00")
+        ).strftime(_DATE_FORMAT)
+        new_content += f"## {version} - {date}\n\n{format_release_notes(release)}\n\n"
+
+    if not new_content:
+        print("Changelog is up to date")
+        return
+
+    _insert_after_header(new_content)
+    print("Changelog updated")
+
+
+if __name__ == "__main__":
+    update_changelog()